@@ -0,0 +1,67 @@
+"""
+Host mode benchmark.
+This runs many clients on a host (CPython) from one thread using an
+eventloop.SelectorLoop, against a stand-in Pedro server running in the same
+process. Each client subscribes to its own ping(ID, N) notifications and then
+in each round every client sends one ping. The time to connect, the
+notification rate and the latency from sending a ping to its delivery are
+reported.
+
+    python3 host_bench.py [clients] [rounds]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import eventloop
+import pedroclient
+from standin_server import StandinServer
+
+CLIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+ROUNDS = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+server = StandinServer()
+server.start()
+loop = eventloop.SelectorLoop()
+
+sent = {}
+latencies = []
+
+def callback(msg):
+    # msg is ping(ID, N)
+    received = time.perf_counter()
+    latencies.append(received - sent.pop(msg))
+
+start = time.perf_counter()
+clients = [pedroclient.PedroClient('127.0.0.1', callback, '127.0.0.1', server.port, loop=loop)
+           for _ in range(CLIENTS)]
+for i, client in enumerate(clients):
+    client.subscribe('ping(' + str(i) + ', N)')
+connected = time.perf_counter() - start
+print(CLIENTS, 'clients connected and subscribed in', round(connected, 3), 's')
+
+start = time.perf_counter()
+for n in range(ROUNDS):
+    for i, client in enumerate(clients):
+        msg = 'ping(' + str(i) + ', ' + str(n) + ')'
+        sent[msg] = time.perf_counter()
+        client.notify(msg)
+    # deliver the pings of this round
+    while sent:
+        loop.run_once(1000)
+elapsed = time.perf_counter() - start
+
+total = CLIENTS * ROUNDS
+latencies.sort()
+print(total, 'notifications in', round(elapsed, 3), 's -',
+      int(total / elapsed), 'per second')
+print('delivery latency: median', round(latencies[len(latencies)//2] * 1000, 3),
+      'ms p99', round(latencies[len(latencies)*99//100] * 1000, 3),
+      'ms max', round(latencies[-1] * 1000, 3), 'ms')
+
+for client in clients:
+    client.disconnect()
+print('readers left in loop:', loop.readers())
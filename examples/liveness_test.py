@@ -0,0 +1,55 @@
+"""
+Dead connection detection test.
+This runs a client on a host (CPython) with heartbeats against the stand-in
+Pedro server. After a few heartbeats the server is made silent (it stops
+reading and responding without closing the connection, as happens when the
+Wi-Fi drops) and the time until the client detects the lost connection is
+reported. The test is then repeated with the server closing the connection.
+
+    python3 liveness_test.py [period] [deadline]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import eventloop
+import liveness
+import pedroclient
+import scheduler
+from standin_server import StandinServer
+
+PERIOD = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+DEADLINE = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+def detect(silent):
+    server = StandinServer()
+    server.start()
+    loop = eventloop.SelectorLoop()
+    lost = []
+    client = pedroclient.PedroClient('127.0.0.1', print, '127.0.0.1', server.port,
+                                     loop=loop, ack_timeout=DEADLINE,
+                                     on_disconnect=lambda c: lost.append(time.perf_counter()))
+    heartbeat = liveness.Heartbeat(client, period=PERIOD, deadline=DEADLINE)
+    tasks = scheduler.Scheduler(client)
+    tasks.add('heartbeat', 50, heartbeat.poll)
+    end = time.perf_counter() + 3 * PERIOD / 1000
+    while time.perf_counter() < end:
+        loop.run_once(tasks.run_once())
+    print('heartbeat round trip', heartbeat.rtt, 'ms')
+    start = time.perf_counter()
+    if silent:
+        server.silent = True
+    else:
+        for c in list(server.clients.values()):
+            server._drop(c)
+    while not lost:
+        loop.run_once(tasks.run_once())
+    server.stop()
+    return (lost[0] - start) * 1000
+
+print('silent server detected after', round(detect(True)), 'ms',
+      '(bound', PERIOD + DEADLINE, 'ms)')
+print('closed connection detected after', round(detect(False)), 'ms')
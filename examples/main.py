@@ -3,12 +3,15 @@ Kitchen Thermometer Example.
 This simple example demonstrates how to use the PedroClient to read temperature data from an AM2320 sensor
 and send it to a Pedro server as a notification. 
 It also allows setting the sample rate via a Pedro notification from another client.
+The sensor also measures humidity and so the readings are published by a scheduler that runs
+a periodic task for each reading.
 Plenty of prints are included to help understand the flow of the program.
 """
 
 import pedroclient
 import connect_wlan
 import prolog_parser
+import scheduler
 
 import time
 import am2320
@@ -35,9 +38,14 @@ clientID = "kitchen_thermometer"
 # This can be set dynamically via a Pedro notification
 sample_rate = 5 # seconds
 
+# The scheduler that runs the sampling tasks - it is created once the client is connected.
+tasks = None
+
 # Althogh if received notification is easy enough to parser within Python, we use a Prolog parser
 # to demonstrate how to handle Prolog terms in a more structured way.
-parser = prolog_parser.PrologParser()
+# As the same set_sample_rate notifications tend to be sent over and over we use a parser
+# that caches the terms it has parsed.
+parser = prolog_parser.CachedParser()
 
 # Callback function to handle incoming notifications from the Pedro server
 # This function is called when a notification is received that matches the subscription (the
@@ -50,11 +58,54 @@ def callback(msg):
         print('Error parsing term:', msg)
         return
     print('Parsed term:', str(term))
-    # update the sample rate.
+    # update the sample rate of both readings (the period must be at least 1 ms).
     global sample_rate
+    period = int(term.args[1].val*1000)
+    if period < 1:
+        print('Sample rate too small:', term.args[1].val)
+        return
     sample_rate = term.args[1].val
+    if tasks is not None:
+        tasks.set_period('temperature', period)
+        tasks.set_period('humidity', period)
     print('Sample rate set to:', sample_rate)
 
+# The sampling tasks - each returns the notification to send (or None if the sensor
+# could not be read).
+# The sensor reads both the temperature and the humidity in one measurement and so when
+# both tasks are due at the same time they share one measurement - the scheduler time
+# (tasks.now) of the last measurement is kept so that the sensor is only measured once
+# each time the scheduler runs the tasks.
+measured_at = None
+measured_ok = False
+
+def measure():
+    global measured_at, measured_ok
+    if measured_at == tasks.now:
+        return measured_ok
+    measured_at = tasks.now
+    try:
+        sensor.measure()
+        measured_ok = True
+    except Exception as e:
+        print('Error reading sensor:', e)
+        measured_ok = False
+    return measured_ok
+
+def sample_temperature():
+    if not measure():
+        return None
+    temperature = sensor.temperature()
+    print('Temperature:', temperature)
+    return 'temperature('+clientID+', '+str(temperature)+')'
+
+def sample_humidity():
+    if not measure():
+        return None
+    humidity = sensor.humidity()
+    print('Humidity:', humidity)
+    return 'humidity('+clientID+', '+str(humidity)+')'
+
 # The status pin is turned off initially to indicate that the device is not connected
 # It is flashed during the connection process to indicate activity and finally stays turned on
 # when the device is connected and active. If an exeption occurs, the status pin is turned off
@@ -89,22 +140,15 @@ try:
     print('subscribed ack:', ack)
     if ack:
         status_pin.on()
-        
-        while True:
-            # Read the sensor data at the specified sample rate and send it to the Pedro server 
-            # as a termperature(clientID, temperature) notification.
-            time.sleep(sample_rate)
-            try:
-                sensor.measure()
-            except Exception as e:
-                print('Error reading sensor:', e)
-                continue    
-            
-            temperature = sensor.temperature()
-            print('Temperature:', temperature)
-            msg = 'temperature('+clientID+', '+str(temperature)+')'
-            ack = client.notify(msg)
-            print('ack', ack, 'msg', msg)
+
+        # Read the sensor data at the specified sample rate and send it to the Pedro server 
+        # as termperature(clientID, temperature) and humidity(clientID, humidity) notifications.
+        # The scheduler keeps to the sample rate (the time taken to read the sensor and send the
+        # notifications does not add up over time) and sends readings that are due together at once.
+        tasks = scheduler.Scheduler(client)
+        tasks.add('temperature', int(sample_rate*1000), sample_temperature)
+        tasks.add('humidity', int(sample_rate*1000), sample_humidity)
+        tasks.run()
 except Exception as e:
     print('Exception', e)
     # If an exception occurs, turn off the status pin to indicate that the device is not functioning properly
@@ -0,0 +1,65 @@
+"""
+RPC latency benchmark.
+This example measures the round trip time of RPC calls through a Pedro server.
+Two clients are connected from the Pico - one answers rpc requests by echoing
+the request term and the other makes calls to it, first one at a time and then
+with many calls outstanding at once.
+"""
+
+import pedroclient
+import connect_wlan
+import rpc
+
+import time
+
+# The IP address of the Pedro server to connect to.
+PEDRO_SERVER_IP = '192.168.0.80'
+
+# The number of calls made in each part of the benchmark
+CALLS = 100
+
+def ignore(msg):
+    pass
+
+ip = connect_wlan.connect_wlan()
+
+server_client = pedroclient.PedroClient(ip, ignore, PEDRO_SERVER_IP, reader_period=5)
+server_client.register('rpc_echo')
+server = rpc.RPC(server_client)
+server.serve(lambda term: term)
+
+client = pedroclient.PedroClient(ip, ignore, PEDRO_SERVER_IP, reader_period=5)
+client.register('rpc_bench')
+caller = rpc.RPC(client, timeout=2000)
+echo = client.peer('rpc_echo')
+
+times = []
+timeouts = 0
+
+def done(result):
+    global timeouts
+    if result is None:
+        timeouts += 1
+
+# sequential calls - each call waits for its reply
+for i in range(CALLS):
+    start = time.ticks_us()
+    id = caller.call(echo, 'ping(' + str(i) + ')', done)
+    caller.wait(id, poll=1)
+    times.append(time.ticks_diff(time.ticks_us(), start))
+times.sort()
+print('sequential: min', times[0], 'us median', times[len(times)//2],
+      'us max', times[-1], 'us timeouts', timeouts)
+
+# concurrent calls - all requests are sent before waiting for the replies
+timeouts = 0
+start = time.ticks_us()
+ids = [caller.call(echo, 'ping(' + str(i) + ')', done) for i in range(CALLS)]
+for id in ids:
+    caller.wait(id, poll=1)
+elapsed = time.ticks_diff(time.ticks_us(), start)
+print('concurrent:', CALLS, 'calls in', elapsed, 'us -', elapsed // CALLS,
+      'us per call, timeouts', timeouts)
+
+client.disconnect()
+server_client.disconnect()
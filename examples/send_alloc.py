@@ -0,0 +1,58 @@
+"""
+Send path allocation check.
+This example sends 10,000 notifications in each of three ways and reports how
+much heap was allocated by the client while doing so:
+
+  bytes - the notification is a fixed byte string. The message and its ack are
+    not copied and the check fails if more than MAX_BYTES_PER_NOTIFICATION are
+    allocated for each notification on average (on MicroPython versions that
+    allocate slices on the heap the copy into the send buffer allocates one).
+  str - the notification is a fixed string. This allocates the utf-8 encoding
+    of the string for each notification (a bytearray can not be assigned a str).
+  term - the notification is a Prolog term from prolog_parser.from_python.
+    write_term allocates the encoded text of each functor, atom and number.
+
+So for steady-state publishing without allocation, send bytes (e.g. built once
+or formatted into a preallocated buffer) or use notify_array for samples.
+"""
+
+import pedroclient
+import prolog_parser
+import connect_wlan
+
+import gc
+
+# The IP address of the Pedro server to connect to.
+PEDRO_SERVER_IP = '192.168.0.80'
+
+NOTIFICATIONS = 10000
+MAX_BYTES_PER_NOTIFICATION = 32
+
+def ignore(msg):
+    pass
+
+def measure(client, msg):
+    """ Return the bytes allocated per notification when sending msg. """
+    # warm up so that the send buffer has reached its final size
+    client.notify(msg)
+    gc.collect()
+    gc.disable()
+    before = gc.mem_alloc()
+    for i in range(NOTIFICATIONS):
+        client.notify(msg)
+    allocated = gc.mem_alloc() - before
+    gc.enable()
+    return allocated / NOTIFICATIONS
+
+ip = connect_wlan.connect_wlan()
+client = pedroclient.PedroClient(ip, ignore, PEDRO_SERVER_IP)
+
+per_bytes = measure(client, b'alloc_test(kitchen_thermometer, 21)')
+per_str = measure(client, 'alloc_test(kitchen_thermometer, 21)')
+per_term = measure(client, prolog_parser.from_python(
+    prolog_parser.Struct('alloc_test', ['kitchen_thermometer', 21])))
+client.disconnect()
+
+print('bytes per notification: bytes', per_bytes, 'str', per_str, 'term', per_term)
+assert per_bytes <= MAX_BYTES_PER_NOTIFICATION, 'the send path allocates too much'
+print('ok')
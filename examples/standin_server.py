@@ -0,0 +1,200 @@
+"""
+A stand-in Pedro server for testing clients on a host (CPython).
+
+This implements just enough of the Pedro protocol to test clients without a
+real Pedro server - the info, ack and data connections, subscriptions,
+notifications, registration and p2p messages. A notification is sent to every
+subscription whose head matches it, where a variable in the head matches
+anything (repeated variables are not checked) - subscription goals are ignored.
+
+If silent is set the server stops reading from (and so responding to) its
+clients while keeping the connections open, as a server does when the network
+drops without the connections being closed.
+
+    server = StandinServer()
+    server.start()      # runs in its own thread
+    ... connect clients to ('127.0.0.1', server.port) ...
+"""
+
+import os
+import selectors
+import socket
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from prolog_parser import PrologParser, PObject
+
+
+class _Client:
+    """ The server side of a client connection. """
+
+    def __init__(self, id, acksock):
+        self.id = id
+        self.acksock = acksock
+        self.datasock = None
+        self.buff = b''
+
+
+class StandinServer:
+    """ A minimal Pedro server. """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.selector = selectors.DefaultSelector()
+        self.infosock = self._listen(port, self._info)
+        self.port = self.infosock.getsockname()[1]
+        self.acklisten = self._listen(0, self._ack)
+        self.datalisten = self._listen(0, self._data)
+        self.parser = PrologParser()
+        self.clients = {}
+        self.next_id = 1
+        # subscription ID -> (client, head, rock)
+        self.subscriptions = {}
+        self.next_sub = 1
+        self.names = {}
+        self.silent = False
+        self.running = False
+
+    def _listen(self, port, handler):
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, port))
+        sock.listen(256)
+        self.selector.register(sock, selectors.EVENT_READ, handler)
+        return sock
+
+    def start(self):
+        """ Run the server in a daemon thread. """
+        self.running = True
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        while self.running:
+            for key, _ in self.selector.select(0.1):
+                key.data(key.fileobj)
+
+    def _info(self, sock):
+        conn, _ = sock.accept()
+        conn.sendall(('%s %d %d\n' % (self.host, self.acklisten.getsockname()[1],
+                                      self.datalisten.getsockname()[1])).encode())
+        conn.close()
+
+    def _ack(self, sock):
+        conn, _ = sock.accept()
+        id = self.next_id
+        self.next_id += 1
+        self.clients[id] = _Client(id, conn)
+        conn.sendall(('%d\n' % id).encode())
+
+    def _data(self, sock):
+        conn, _ = sock.accept()
+        # the first line is the client ID from the ack connection
+        buff = b''
+        while b'\n' not in buff:
+            buff += conn.recv(64)
+        client = self.clients[int(buff)]
+        client.datasock = conn
+        conn.sendall(b'ok\n')
+        self.selector.register(conn, selectors.EVENT_READ,
+                               lambda s, c=client: self._read(c))
+
+    def _read(self, client):
+        if self.silent:
+            return
+        chars = client.datasock.recv(65536)
+        if not chars:
+            self._drop(client)
+            return
+        client.buff += chars
+        while b'\n' in client.buff:
+            line, client.buff = client.buff.split(b'\n', 1)
+            ack = self._message(client, line.decode('utf-8'))
+            client.acksock.sendall(('%d\n' % ack).encode())
+
+    def _drop(self, client):
+        self.selector.unregister(client.datasock)
+        client.datasock.close()
+        client.acksock.close()
+        del self.clients[client.id]
+        for id, sub in list(self.subscriptions.items()):
+            if sub[0] is client:
+                del self.subscriptions[id]
+        for name, c in list(self.names.items()):
+            if c is client:
+                del self.names[name]
+
+    def _deliver(self, client, rock, line):
+        try:
+            client.datasock.sendall(('%d %s\n' % (rock, line)).encode('utf-8'))
+        except OSError:
+            pass
+
+    def _message(self, client, line):
+        """ Process a message from client and return the ack. """
+        term = self.parser.parse(line)
+        if term is None:
+            return 0
+        if term.type == PObject.structtype:
+            functor = term.functor.val
+            args = term.args
+            if functor == 'subscribe' and len(args) == 3:
+                id = self.next_sub
+                self.next_sub += 1
+                self.subscriptions[id] = (client, args[0], args[2].val)
+                return id
+            if functor == 'unsubscribe' and len(args) == 1:
+                return args[0].val if self.subscriptions.pop(args[0].val, None) else 0
+            if functor == 'register' and len(args) == 1:
+                self.names[str(args[0])] = client
+                return 1
+            if functor == 'deregister' and len(args) == 1:
+                self.names.pop(str(args[0]), None)
+                return 1
+            if functor == 'p2pmsg' and len(args) == 3:
+                to = args[0]
+                if to.type == PObject.structtype and to.functor.val == '@':
+                    to = to.args[0]
+                target = self.names.get(str(to))
+                if target is None:
+                    return 0
+                self._deliver(target, 0, line)
+                return 1
+        for sub in list(self.subscriptions.values()):
+            if _matches(sub[1], term):
+                self._deliver(sub[0], sub[2], line)
+        return 1
+
+
+def _matches(head, term):
+    """ Test if term matches the subscription head. """
+    todo = [(head, term)]
+    while todo:
+        h, t = todo.pop()
+        if h.type == PObject.vartype:
+            continue
+        if h.type != t.type:
+            return False
+        if h.type == PObject.structtype:
+            if h.functor != t.functor or h.arity() != t.arity():
+                return False
+            todo.extend(zip(h.args, t.args))
+        elif h.type == PObject.listtype:
+            todo.append((h.head, t.head))
+            todo.append((h.tail, t.tail))
+        elif h != t:
+            return False
+    return True
+
+
+if __name__ == '__main__':
+    server = StandinServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 4550)
+    print('stand-in Pedro server on port', server.port)
+    server.running = True
+    server.run()
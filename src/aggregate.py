@@ -0,0 +1,118 @@
+#  Copyright (C) 2025 Peter Robinson
+#  Email: pjr4171@gmail.com
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+""" Windowed aggregation of samples.
+
+Rather than publishing every sample, a Channel collects the samples of one
+reading (e.g. a sensor) and publishes a single summary notification
+
+    summary(Name, Count, Min, Max, Mean)
+
+for each window of samples. If percentiles are requested the summary has
+an extra argument - the list of the requested percentiles of the window.
+
+A window is the last size samples. With a tumbling window (the default) the
+windows do not overlap - a summary is published every size samples. With a
+sliding window a summary of the last size samples is published every step
+samples.
+
+The samples are kept in an array used as a ring buffer and so each channel
+uses a fixed amount of memory however many samples it is given.
+"""
+
+from array import array
+from prolog_parser import Struct, from_python
+
+
+class Channel:
+    """ The windowed summaries of the samples of one reading.
+
+    The methods are:
+
+    add(x) - add the sample x - a summary is published if a window is
+      complete.
+
+    summary() - return the summary of the current window as a Struct.
+
+    reset() - discard the samples collected so far.
+    """
+
+    def __init__(self, client, name, size, step=None, functor='summary',
+                 percentiles=(), typecode='f'):
+        """ Initialize the channel.
+        client: the PedroClient used to publish the summaries.
+        name: the name of the channel (the first argument of the summary).
+        size: the number of samples in a window.
+        step: the number of samples between summaries - None (or size)
+            for tumbling windows and less than size for sliding windows.
+        functor: the functor of the summary notification.
+        percentiles: the percentiles (0-100) to include in the summary.
+        typecode: the array typecode used to store the samples.
+        """
+        self.client = client
+        self.name = name
+        self.size = size
+        self.step = size if step is None else step
+        self.functor = functor
+        self.percentiles = percentiles
+        self.buf = array(typecode, (0 for _ in range(size)))
+        self.reset()
+
+    def reset(self):
+        """ Discard the samples collected so far. """
+        # the position of the next sample in the ring buffer
+        self.pos = 0
+        # the number of samples in the buffer
+        self.count = 0
+        # the number of samples since the last summary
+        self.since = 0
+
+    def add(self, x):
+        """ Add the sample x and publish a summary if a window is complete. """
+        self.buf[self.pos] = x
+        self.pos += 1
+        if self.pos == self.size:
+            self.pos = 0
+        if self.count < self.size:
+            self.count += 1
+        self.since += 1
+        if self.count == self.size and self.since >= self.step:
+            self.since = 0
+            self.client.notify(from_python(self.summary()))
+
+    def summary(self):
+        """ Return the summary of the samples in the current window. """
+        buf = self.buf
+        count = self.count
+        if count == 0:
+            return Struct(self.functor, [self.name, 0, 0, 0, 0])
+        # while the buffer is filling the samples are at the start
+        lo = hi = buf[0]
+        total = 0
+        for i in range(count):
+            x = buf[i]
+            if x < lo:
+                lo = x
+            elif x > hi:
+                hi = x
+            total += x
+        args = [self.name, count, lo, hi, total / count]
+        if self.percentiles:
+            ordered = sorted(buf[i] for i in range(count))
+            args.append([ordered[min(count-1, int(p * count / 100))]
+                         for p in self.percentiles])
+        return Struct(self.functor, args)
@@ -0,0 +1,82 @@
+#  Copyright (C) 2025 Peter Robinson
+#  Email: pjr4171@gmail.com
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+""" Event loop for running Pedro clients on a host (CPython).
+
+On the Pico each client's reader polls its socket from a machine.Timer. On a
+host (such as a Linux gateway) there is no Timer and instead the readers of
+any number of clients are added to a SelectorLoop which waits (using the
+selectors module - epoll on Linux) until one or more sockets have data and
+then calls the readers of those sockets. A scheduler.Scheduler can be run by
+the loop between reads.
+
+    loop = eventloop.SelectorLoop()
+    client = pedroclient.PedroClient(ip, callback, server, loop=loop)
+    ...
+    loop.run()
+"""
+
+import selectors
+
+
+class SelectorLoop:
+    """ Run the readers of many clients from one thread.
+
+    The methods are:
+
+    add_reader(reader) - start calling reader.read() when its socket
+      has data (called by the reader).
+
+    remove_reader(reader) - stop calling the reader (called by the reader).
+
+    run_once(timeout) - wait up to timeout ms for data and call the
+      readers - the number of readers called is returned.
+
+    run(scheduler) - run the readers (and the scheduler if given) until
+      there are no readers left.
+    """
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+
+    def add_reader(self, reader):
+        """ Add the reader to the loop. """
+        self.selector.register(reader.sock, selectors.EVENT_READ, reader)
+
+    def remove_reader(self, reader):
+        """ Remove the reader from the loop. """
+        try:
+            self.selector.unregister(reader.sock)
+        except (KeyError, ValueError):
+            pass
+
+    def readers(self):
+        """ Return the number of readers in the loop. """
+        return len(self.selector.get_map())
+
+    def run_once(self, timeout=-1):
+        """ Wait up to timeout ms (for ever if negative) and run the readers. """
+        events = self.selector.select(None if timeout < 0 else timeout / 1000)
+        for key, _ in events:
+            key.data.read()
+        return len(events)
+
+    def run(self, scheduler=None):
+        """ Run until there are no readers, running scheduler between reads. """
+        while self.readers():
+            timeout = -1 if scheduler is None else scheduler.run_once()
+            self.run_once(timeout)
@@ -0,0 +1,127 @@
+#  Copyright (C) 2025 Peter Robinson
+#  Email: pjr4171@gmail.com
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+""" Last-value store of received notifications.
+
+Often an application only needs the latest value of some notification, for
+example the latest set_sample_rate(kitchen_thermometer, Rate). A LastValues
+store keeps, for each tracked functor/arity, the latest notification for each
+value of a chosen key argument together with the time it was received:
+
+    values = lastvalue.LastValues(client)
+    values.track('set_sample_rate', 2, key_arg=0)
+    ...
+    entry = values.get('set_sample_rate', 2, 'kitchen_thermometer')
+    if entry is not None:
+        term, received = entry
+
+The store is updated by the client's reader as the notifications arrive (it
+does not consume them - they are still passed to the callback). If a
+notification has exactly the same text as the latest value for its key only
+the receive time is updated - it is not parsed again.
+"""
+
+from collections import OrderedDict
+import ticks
+from prolog_parser import PrologParser, PObject
+
+
+class LastValues:
+    """ The latest value of tracked notifications.
+
+    The methods are:
+
+    track(functor, arity, key_arg) - keep the latest notification with the
+      given functor and arity for each value of argument key_arg (0 based).
+
+    get(functor, arity, key) - return (term, ticks_ms when received) for the
+      latest notification with the given key (a string - the text of the key
+      argument) or None if there is none.
+
+    clear() - discard all the values.
+    """
+
+    def __init__(self, client, max_entries=32):
+        """ Initialize the store.
+        client: the PedroClient whose notifications are stored - it must have a reader.
+        max_entries: the maximum number of values kept - the least recently
+            updated value is discarded first.
+        """
+        self.max_entries = max_entries
+        self.parser = PrologParser()
+        # functor -> {arity: key_arg}
+        self.tracked = {}
+        self.clear()
+        client.add_handler(self._handle)
+
+    def track(self, functor, arity, key_arg=0):
+        """ Keep the latest values of functor/arity keyed on key_arg.
+
+        A ValueError is raised if key_arg is not an argument position
+        (0 <= key_arg < arity).
+        """
+        if not 0 <= key_arg < arity:
+            raise ValueError('key_arg must be in range(' + str(arity) + '): ' + str(key_arg))
+        self.tracked.setdefault(functor, {})[arity] = key_arg
+
+    def clear(self):
+        """ Discard all the values. """
+        # (functor, arity, key) -> [term, ticks, text, key]
+        self.values = OrderedDict()
+        # text -> the entry of the values with that text
+        self.texts = {}
+
+    def get(self, functor, arity, key):
+        """ Return (term, ticks) for the latest value of key (or None). """
+        entry = self.values.get((functor, arity, key))
+        if entry is None:
+            return None
+        return (entry[0], entry[1])
+
+    def _handle(self, message):
+        """ The client handler - store tracked notifications. """
+        entry = self.texts.get(message)
+        if entry is not None:
+            # the same as the latest value - no need to parse
+            entry[1] = ticks.ticks_ms()
+            # move to the most recently updated end
+            self.values[entry[3]] = self.values.pop(entry[3])
+            return False
+        pos = message.find('(')
+        if pos == -1:
+            return False
+        arities = self.tracked.get(message[:pos])
+        if arities is None:
+            return False
+        term = self.parser.parse(message)
+        if term is None or term.type != PObject.structtype:
+            return False
+        arity = term.arity()
+        key_arg = arities.get(arity)
+        if key_arg is None:
+            return False
+        key = (term.functor.val, arity, str(term.args[key_arg]))
+        old = self.values.pop(key, None)
+        if old is not None:
+            del self.texts[old[2]]
+        elif len(self.values) >= self.max_entries:
+            oldest = next(iter(self.values))
+            del self.texts[self.values.pop(oldest)[2]]
+        entry = [term, ticks.ticks_ms(), message, key]
+        self.values[key] = entry
+        self.texts[message] = entry
+        return False
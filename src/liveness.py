@@ -0,0 +1,112 @@
+#  Copyright (C) 2025 Peter Robinson
+#  Email: pjr4171@gmail.com
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+""" Heartbeats for detecting a dead connection to the Pedro server.
+
+When the Wi-Fi drops the TCP connection to the server is usually not closed -
+it is just silent. A Heartbeat detects this by subscribing to its own
+heartbeat notification
+
+    pedro_heartbeat(ID, N)
+
+(ID is the client's ID from the server) and periodically sending one. If the
+notification does not come back through the server within the deadline the
+connection is treated as lost - the client is disconnected and its
+on_disconnect callback is called. If the client's ack_timeout (which bounds
+the wait for the ack of the heartbeat itself) is no longer than the deadline,
+a dead connection is detected within period + deadline ms (plus the time
+between calls to poll).
+
+poll() must be called regularly - from the main loop or as a scheduler task:
+
+    heartbeat = liveness.Heartbeat(client, period=5000, deadline=2000)
+    tasks.add('heartbeat', 500, heartbeat.poll)
+"""
+
+import ticks
+
+
+class Heartbeat:
+    """ Periodic heartbeats through the server.
+
+    The methods are:
+
+    start() - subscribe to the heartbeat notifications (called on creation
+      and to be called again after reconnecting).
+
+    poll() - send a heartbeat if one is due and check the deadline of the
+      outstanding heartbeat.
+
+    The attributes alive (False once the connection is treated as lost) and
+    rtt (the last round trip time in ms) can be read at any time.
+    """
+
+    def __init__(self, client, period=10000, deadline=3000):
+        """ Initialize the heartbeat.
+        client: the PedroClient to check - it must have a reader.
+        period: the time (in ms) between heartbeats.
+        deadline: the time (in ms) allowed for a heartbeat to come back.
+        """
+        self.client = client
+        self.period = period
+        self.deadline = deadline
+        client.add_handler(self._handle)
+        self.start()
+
+    def start(self):
+        """ Subscribe to this client's heartbeats. """
+        self.id = self.client.id_string.strip()
+        self.prefix = 'pedro_heartbeat(' + self.id + ','
+        self.seq = 0
+        # the ticks when the outstanding heartbeat was sent (None if none)
+        self.sent = None
+        self.next = ticks.ticks_ms()
+        self.rtt = -1
+        self.alive = self.client.subscribe(self.prefix + ' N)') != 0
+
+    def poll(self):
+        """ Send a heartbeat if due and check for a missed deadline. """
+        if not self.alive:
+            return None
+        if not self.client.connected:
+            self.alive = False
+            return None
+        now = ticks.ticks_ms()
+        if self.sent is not None:
+            if ticks.ticks_diff(now, self.sent) > self.deadline:
+                # the heartbeat has not come back
+                self.alive = False
+                self.client.connection_lost()
+            return None
+        if ticks.ticks_diff(now, self.next) >= 0:
+            self.seq += 1
+            self.sent = now
+            self.next = ticks.ticks_add(now, self.period)
+            if not self.client.notify(self.prefix + ' ' + str(self.seq) + ')'):
+                self.alive = False
+        # the return value is None so that poll can be a scheduler task
+        return None
+
+    def _handle(self, message):
+        """ The client handler - consume this client's heartbeats. """
+        if not message.startswith(self.prefix):
+            return False
+        if message[len(self.prefix):-1].strip() == str(self.seq) and \
+           self.sent is not None:
+            self.rtt = ticks.ticks_diff(ticks.ticks_ms(), self.sent)
+            self.sent = None
+        return True
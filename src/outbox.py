@@ -0,0 +1,108 @@
+#  Copyright (C) 2025 Peter Robinson
+#  Email: pjr4171@gmail.com
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+""" Priority lanes for outgoing notifications.
+
+Notifications are queued in lanes - lane 0 (HIGH) for things like alarms and
+control responses and lane 1 (LOW) for bulk telemetry. When the outbox is
+flushed the notifications are sent in batches (pipelined with
+PedroClient.notify_many) and each batch is filled from the highest priority
+lane first. As the lanes are checked again for every batch, a high priority
+notification queued while a telemetry backlog is being sent only waits for
+the batch already being sent.
+
+Each lane has a bound on the number of queued notifications. When a lane is
+full either the oldest notification is dropped (sensible for telemetry where
+only recent readings matter) or the new notification is refused.
+"""
+
+from collections import deque
+
+HIGH = 0
+LOW = 1
+
+
+class Outbox:
+    """ Outgoing notifications queued in priority lanes.
+
+    The methods are:
+
+    send(term, lane) - queue the notification term in lane - False is
+      returned if the lane is full and term was refused.
+
+    flush_once() - send one batch of notifications - the number sent is
+      returned.
+
+    flush() - send all the queued notifications.
+
+    pending() - the number of queued notifications.
+    """
+
+    def __init__(self, client, bounds=(16, 64), drop_oldest=(False, True),
+                 batch=8):
+        """ Initialize the outbox.
+        client: the PedroClient used to send the notifications.
+        bounds: the maximum number of queued notifications in each lane
+            (highest priority first).
+        drop_oldest: for each lane, whether the oldest notification is
+            dropped when the lane is full (otherwise the new one is refused).
+        batch: the maximum number of notifications sent together.
+        """
+        self.client = client
+        self.bounds = bounds
+        self.drop_oldest = drop_oldest
+        self.batch = batch
+        self.lanes = [deque((), bound) for bound in bounds]
+        # counts of notifications dropped (or refused) and not accepted
+        # by the server
+        self.dropped = 0
+        self.failed = 0
+
+    def send(self, term, lane=LOW):
+        """ Queue the notification term in lane. """
+        queue = self.lanes[lane]
+        if len(queue) >= self.bounds[lane]:
+            self.dropped += 1
+            if not self.drop_oldest[lane]:
+                return False
+            queue.popleft()
+        queue.append(term)
+        return True
+
+    def pending(self):
+        """ Return the number of queued notifications. """
+        return sum(len(queue) for queue in self.lanes)
+
+    def flush_once(self):
+        """ Send a batch of notifications, highest priority first. """
+        terms = []
+        for queue in self.lanes:
+            while queue and len(terms) < self.batch:
+                terms.append(queue.popleft())
+        if terms:
+            acks = self.client.notify_many(terms)
+            self.failed += acks.count(0)
+        return len(terms)
+
+    def flush(self):
+        """ Send all the queued notifications and return the number sent. """
+        total = 0
+        sent = self.flush_once()
+        while sent:
+            total += sent
+            sent = self.flush_once()
+        return total
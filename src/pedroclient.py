@@ -31,57 +31,264 @@ This is overkill for the Pico (and uses too many valuable resources) and so we u
 approach that uses a timer to poll the data socket for incoming messages.
 
 Although supplied, peer-to-peer messages are probably not needed for Pico applications
+
+The client also runs on CPython (e.g. on a gateway) - there is no machine.Timer
+and so instead the readers of any number of clients are run from one thread
+by an event loop (see eventloop.SelectorLoop).
 """
 
-import re, socket, _thread, select
+import re, socket, _thread, select, errno
+from math import isinf, isnan
 import sys
-from machine import Timer
+try:
+    from machine import Timer
+except ImportError:
+    # not on a Pico - readers must be run by a loop
+    Timer = None
+from prolog_parser import StreamParser, PObject, write_term
+import ticks
 
 # For encoding and decoding messages sent over the socket.
 def to_str(b):
     return b.decode("utf-8")
 def from_str(b):
     return b.encode('utf-8')
+
+def _recv_into(sock):
+    """ Return the method of sock for receiving into a buffer.
+    (MicroPython sockets have readinto instead of recv_into) """
+    return getattr(sock, 'recv_into', None) or sock.readinto
     
 
 
 class Reader:
     """The message reader. This reads incoming Pedro messages and processes them
-    using the user defined callback function and a timer with the supplied period."""
+    using the user defined callback function and a timer with the supplied period.
+
+    If a loop is supplied (such as eventloop.SelectorLoop) the reader is instead
+    added to the loop, which calls read() whenever the socket has data.
+
+    If the server closes (or resets) the connection the reader stops and
+    calls on_close()."""
 
-    def __init__( self, sock, callback, period):
+    def __init__( self, sock, callback, period, loop=None, on_close=None):
         self.sock = sock
         self.callback = callback
+        self.on_close = on_close
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         sock.setblocking(False)
-        self.timer = Timer()
-        self.timer.init(mode=Timer.PERIODIC, period=period, callback=self.get_message)
-        self.poller = select.poll()
-        self.poller.register(sock, select.POLLIN)
-        self.buff = ""
+        # splits the incoming bytes into messages (with the rock removed)
+        self.stream = StreamParser(callback, raw=True)
+        # the data is received straight into the stream's buffer
+        self.recv_into = _recv_into(sock)
+        self.loop = loop
+        self.timer = None
+        if loop is not None:
+            loop.add_reader(self)
+        else:
+            self.timer = Timer()
+            self.timer.init(mode=Timer.PERIODIC, period=period, callback=self.get_message)
+            self.poller = select.poll()
+            self.poller.register(sock, select.POLLIN)
         
     def get_message(self, timer):
+        stream = self.stream
         fdVsEvent = self.poller.poll(1)
         while fdVsEvent:
-            chars = self.sock.recv(1024)
-            if (chars == ''):
-                timer.deinit()
+            try:
+                n = self.recv_into(stream.space())
+            except OSError as e:
+                if e.args[0] == errno.EAGAIN:
+                    return
+                # e.g. ECONNRESET or ETIMEDOUT - the connection has gone
+                self._closed()
+                return
+            if n is None:
+                # no data after all
                 return
-            self.buff = self.buff + to_str(chars)
-            pos = self.buff.find('\n')
-            while (pos != -1):
-                message = self.buff[:pos]
-                # ignore the rock
-                _, message = message.split(" ", 1)
-                # call the user defined callback
-                self.callback(message)
-                self.buff = self.buff[(pos+1):]
-                pos = self.buff.find('\n')
+            if not n:
+                # no data when the socket is readable means the
+                # connection has been closed
+                self._closed()
+                return
+            # call the user defined callback on each complete message
+            stream.received(n)
             fdVsEvent = self.poller.poll(1)
+
+    def read(self):
+        """ Read and process the data available on the (non-blocking) socket. """
+        stream = self.stream
+        while True:
+            space = stream.space()
+            try:
+                n = self.recv_into(space)
+            except OSError as e:
+                if e.args[0] == errno.EAGAIN:
+                    return
+                # e.g. ECONNRESET - the connection has gone
+                self._closed()
+                return
+            if n is None:
+                return
+            if not n:
+                # the connection has been closed
+                self._closed()
+                return
+            stream.received(n)
+            if n < len(space):
+                return
+
+    def _closed(self):
+        """ The connection has been closed by the server. """
+        self.close()
+        if self.on_close is not None:
+            self.on_close()
+
+    def close(self):
+        """ Stop reading. """
+        if self.timer is not None:
+            self.timer.deinit()
+            self.timer = None
+        if self.loop is not None:
+            self.loop.remove_reader(self)
+            self.loop = None
         
+class SendBuffer:
+    """A reusable buffer for outgoing messages.
+
+    Each command is written into the buffer and then sent with flush(). The
+    buffer is only reallocated when a message is larger than any before it,
+    and flush() keeps sending until the whole message has been written as a
+    send may write only part of the buffer (in particular when the socket is
+    non-blocking, as it is when there is a reader)."""
+
+    def __init__(self, sock, size=256):
+        """ sock is None for a buffer that is only written to. """
+        self.sock = sock
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        # the number of bytes in the buffer
+        self.n = 0
+        if sock is not None:
+            self.poller = select.poll()
+            self.poller.register(sock, select.POLLOUT)
+
+    def write(self, data):
+        """ Add the bytes in data to the buffer. """
+        n = self.n
+        end = n + len(data)
+        if end > len(self.buf):
+            self._grow(end)
+        self.buf[n:end] = data
+        self.n = end
+
+    def add(self, x):
+        """ Add x (bytes, a Prolog term or any other object as a string). """
+        if isinstance(x, bytes):
+            self.write(x)
+        elif isinstance(x, PObject):
+            write_term(x, self)
+        else:
+            self.write(from_str(str(x)))
+
+    def _grow(self, size):
+        """ Make the buffer at least size bytes keeping its contents. """
+        buf = bytearray(max(size, 2*len(self.buf)))
+        buf[:self.n] = self.view[:self.n]
+        self.buf = buf
+        self.view = memoryview(buf)
+
+    def flush(self, timeout=-1):
+        """ Send the contents of the buffer and empty it.
+
+        False is returned if the socket fails or cannot take more data
+        within timeout ms (if timeout is not negative).
+        """
+        view = self.view
+        n = self.n
+        self.n = 0
+        pos = 0
+        sock = self.sock
+        # MicroPython streams can write part of a buffer without a slice
+        # of it being made (and allocated)
+        write = getattr(sock, 'write', None)
+        while pos < n:
+            try:
+                if write is not None:
+                    sent = write(self.buf, pos, n - pos)
+                else:
+                    sent = sock.send(view[pos:n])
+            except OSError as e:
+                if e.args[0] != errno.EAGAIN:
+                    return False
+                sent = 0
+            if not sent:
+                # wait until the socket can take more
+                if not self.poller.poll(timeout):
+                    return False
+                continue
+            pos += sent
+        return True
+
+# The number of samples formatted together by notify_array and the format
+# strings for chunks of samples keyed on (conversion, number of samples).
+_SAMPLE_CHUNK = 32
+_sample_formats = {}
+
+def _samples_format(conv, n):
+    """ Return the format string for n samples using conversion conv. """
+    key = (conv, n)
+    fmt = _sample_formats.get(key)
+    if fmt is None:
+        fmt = ', '.join([conv] * n)
+        _sample_formats[key] = fmt
+    return fmt
+
+def _latency_summary(times):
+    """ Return (min, median, p99) of times (None if there are none). """
+    if not times:
+        return None
+    times.sort()
+    n = len(times)
+    return (times[0], times[n // 2], times[min(n - 1, n * 99 // 100)])
+
 # for testing if a P2P address is a variable
 _p2p_var_addr = re.compile("^[_A-Z][^:]*$")
 
+class Peer:
+    """ A p2p address compiled for sending many messages.
+
+    The encoded start of the p2p message (including the sender address) is
+    built once and reused, and rebuilt only if the client's name changes, so
+    sending a message only needs the term to be encoded.
+    Peers are created by PedroClient.peer(addr).
+    """
+
+    def __init__(self, client, toaddr):
+        self.client = client
+        self.addr = toaddr
+        self.prefix = None
+        self.version = -1
+
+    def p2p(self, term):
+        """ Send term to the peer and return the ack. """
+
+        client = self.client
+        if (client.name == '' or not client.connected):
+            return 0
+        if self.version != client.name_version:
+            self.prefix = from_str(client._p2p_prefix(self.addr))
+            self.version = client.name_version
+        buf = client._begin()
+        try:
+            buf.write(self.prefix)
+            buf.add(term)
+            buf.write(b')\n')
+        except:
+            client._abort(buf)
+            raise
+        return client._send(buf)
+
 class PedroClient:
     """ A Pedro Client.
 
@@ -89,6 +296,9 @@ class PedroClient:
     The methods are:
 
     disconnect() - disconnect from server
+
+    connection_lost() - treat the connection as lost - disconnect and call
+      on_disconnect.
     
     connect() - reconnect to server
     
@@ -96,6 +306,12 @@ class PedroClient:
       a string representation of a Prolog term - 1 is returned if
       the server accepts term; 0 otherwise.
 
+    notify_many(terms) - send several notifications at once - the list
+      of acks is returned.
+
+    notify_array(functor, arg, ..., samples) - send a notification whose
+      last argument is the list of numbers in the array samples.
+
     subscribe(term, goal) - subscribe to terms that match term and
       that satisfy goal. Both term and goal are string representations
       of Prolog terms. The ID of the subscription is returned. The ID is
@@ -112,6 +328,11 @@ class PedroClient:
 
     p2p(addr, term) - send term as a p2p message to addr.
 
+    peer(addr) - return a Peer for repeatedly sending p2p messages to addr.
+
+    probe_latency(n) - measure the latency of n notifications sent through
+      the server back to this client.
+
     get_notification() - get the first notification from the message queue
       of notifications sent from the server as a string.
 
@@ -121,10 +342,20 @@ class PedroClient:
     notification_ready() - test if a notification is ready to read.
 
     parse_string(string) - parse string into a Prolog term.
+
+    add_handler(handler) - add a handler that sees incoming messages
+      before the user callback.
+
+    A notification or p2p message sent from a callback while another command
+    is being sent (the reader's timer can run callbacks at any time) is queued
+    and sent as soon as that command has finished - 0 is returned as its ack.
+    subscribe, unsubscribe, register and deregister are refused (0 is
+    returned and nothing is sent) at such times as their results are needed.
     """
     
     def __init__(self, ip_addr, callback, machine='localhost',
-                 port=4550, reader_period = -1):
+                 port=4550, reader_period = -1, loop = None,
+                 ack_timeout = -1, on_disconnect = None):
         """ Initialize the client.
         ip_addr: the IP address of this client
             - used for peer-to-peer messages.
@@ -133,16 +364,42 @@ class PedroClient:
         machine: the address of the machine the Pedro server is running.
         port: the port the Pedro server is using for connections.
         reader_period: the period for the timer in the socket reader. A reader is only
-           created if this is greater than 0.
+           created if this is greater than 0 (or a loop is given).
+        loop: an event loop (e.g. eventloop.SelectorLoop) that runs the reader
+           instead of a timer - required when not running on a Pico (a
+           ValueError is raised if a reader_period is given without a loop
+           where there is no machine.Timer).
+        ack_timeout: if greater than 0, the time (in ms) to wait for an ack (or
+           for the socket to take a message) before the connection is treated
+           as lost.
+        on_disconnect: called with the client when the connection is lost
+           (closed by the server or an ack timeout).
         """
+        if reader_period > 0 and loop is None and Timer is None:
+            raise ValueError('a loop is required when machine.Timer is not available')
         self.machine = machine
         self.port = port
         self.reader_period = reader_period
+        self.loop = loop
+        self.ack_timeout = ack_timeout
+        self.on_disconnect = on_disconnect
         self.reader = None
         self.connected = False
         self.callback = callback
+        self.handlers = []
+        # set while a command is being sent - commands sent by callbacks
+        # in the meantime are queued in deferred (see _begin)
+        self.sending = False
+        self.deferred = []
+        # the state of probe_latency - the start of this client's probe
+        # messages (None before the first probe) and the probes in progress
+        self.probe_prefix = None
+        self.probes = None
         self.connect()
         self.name = ''
+        # incremented each time the name changes so that peers can
+        # tell when their compiled messages are out of date
+        self.name_version = 0
         self.my_machine_name = ip_addr
         
     def getDataSocket(self):
@@ -182,10 +439,26 @@ class PedroClient:
             buff = buff + to_str(chars)
             pos = buff.find('\n')
         self.id_string = buff
+        # the acks are read into ackbuf - ackn is the number of bytes in it
+        self.ackbuf = bytearray(32)
+        self.ackview = memoryview(self.ackbuf)
+        self.ackn = 0
+        self.ackpoller = None
+        if hasattr(self.acksock, 'recv_into'):
+            if self.ack_timeout > 0:
+                self.acksock.settimeout(self.ack_timeout / 1000)
+        else:
+            # On MicroPython readinto on a blocking socket waits until the
+            # whole buffer is full and so the socket is made non-blocking
+            # and polled for each ack instead
+            self.acksock.setblocking(False)
+            self.ackpoller = select.poll()
+            self.ackpoller.register(self.acksock, select.POLLIN)
         # connect to data
         self.datasock = socket.socket()
         self.datasock.connect((self.machine, data_port))
         self.datasock.send(from_str(self.id_string))
+        self.sendbuf = SendBuffer(self.datasock)
         # get ok from server on data socket
         pos = -1
         buff = ''
@@ -205,15 +478,35 @@ class PedroClient:
         
         self.connected = True
         # create a reader if required.
-        if (self.reader_period > 0):
-            self.reader = Reader(self.datasock, self.callback, self.reader_period)
-   
+        if (self.reader_period > 0 or self.loop is not None):
+            self.reader = Reader(self.datasock, self._dispatch, self.reader_period,
+                                 self.loop, self.connection_lost)
+
+    def add_handler(self, handler):
+        """ Add handler to the chain of message handlers.
+
+        Each incoming message is passed to the handlers in the order they
+        were added before it is passed to the user callback. If a handler
+        returns True the message is consumed and is not passed any further.
+        This is how layers such as rpc.RPC see their own messages.
+        """
+        self.handlers.append(handler)
+
+    def _dispatch(self, message):
+        """ Pass message through the handlers and then to the callback. """
+        for handler in self.handlers:
+            if handler(message):
+                return
+        self.callback(message)
 
     def disconnect(self):
         """ Disconnect the client. """
         
         if (self.connected):
             self.connected = False
+            if self.reader is not None:
+                self.reader.close()
+                self.reader = None
             try:
                 self.acksock.shutdown(socket.SHUT_RDWR)
                 self.acksock.close()
@@ -227,31 +520,231 @@ class PedroClient:
                     
     def get_ack(self):
         """ Get an acknowledgement from the server. """
-        
-        pos = -1
-        buff = ''
-        while (pos == -1):
-            chars = self.acksock.recv(32)
-            buff = buff + to_str(chars)
-            pos = buff.find('\n')
-        r = int(buff)   
-        return r
-    
+
+        # The ack is read into a preallocated buffer and its digits are
+        # converted as they are scanned, so reading an ack does not allocate.
+        # When messages are pipelined several acks can arrive together
+        # and so any following acks are kept for the next call.
+        buf = self.ackbuf
+        n = self.ackn
+        while True:
+            r = 0
+            for i in range(n):
+                c = buf[i]
+                if c == 10:
+                    rest = n - i - 1
+                    for j in range(rest):
+                        buf[j] = buf[i + 1 + j]
+                    self.ackn = rest
+                    return r
+                r = r * 10 + c - 48
+            if n == 0:
+                k = self._recv_ack(buf)
+            else:
+                k = self._recv_ack(self.ackview[n:])
+            if not k:
+                self.ackn = 0
+                self.connection_lost()
+                return 0
+            n += k
+
+    def _recv_ack(self, buf):
+        """ Receive into buf from the ack socket and return the number of
+        bytes received - 0 if the connection is closed or nothing arrives
+        within ack_timeout. """
+        sock = self.acksock
+        try:
+            if self.ackpoller is None:
+                return sock.recv_into(buf)
+            while True:
+                # ipoll (unlike poll) does not allocate
+                ready = False
+                for _ in self.ackpoller.ipoll(self.ack_timeout):
+                    ready = True
+                if not ready:
+                    return 0
+                k = sock.readinto(buf)
+                if k is not None:
+                    return k
+        except OSError:
+            return 0
+
+    def _begin(self):
+        """ Start a command and return the buffer to build it in.
+
+        If another command is in progress (a callback run by the reader
+        timer is sending) the command is built in a buffer of its own and
+        queued to be sent once the command in progress has finished - only
+        commands whose ack is not needed (notifications and p2p messages)
+        are queued.
+        """
+        if self.sending:
+            return SendBuffer(None, 64)
+        self.sending = True
+        return self.sendbuf
+
+    def _abort(self, buf):
+        """ Discard the command being built in buf (building it failed). """
+        buf.n = 0
+        if buf is self.sendbuf:
+            self._end()
+
+    def _send(self, buf, count=0):
+        """ Send the command in buf and return the ack.
+
+        If count is greater than 0 buf holds count commands and the list of
+        their acks is returned. A queued command (see _begin) is acked 0 as
+        its ack is not known yet.
+        """
+        if buf is not self.sendbuf:
+            self.deferred.append((bytes(buf.view[:buf.n]), count))
+            return [0] * count if count else 0
+        try:
+            if not buf.flush(self.ack_timeout):
+                self.connection_lost()
+                return [0] * count if count else 0
+            if count:
+                return [self.get_ack() for _ in range(count)]
+            return self.get_ack()
+        finally:
+            self._end()
+
+    def _end(self):
+        """ Finish the command in progress and send any queued commands. """
+        deferred = self.deferred
+        while True:
+            while deferred and self.connected:
+                data, count = deferred.pop(0)
+                buf = self.sendbuf
+                buf.write(data)
+                if not buf.flush(self.ack_timeout):
+                    self.connection_lost()
+                    break
+                for _ in range(max(count, 1)):
+                    self.get_ack()
+            if not self.connected:
+                del deferred[:]
+            self.sending = False
+            # a callback may have queued a command before sending was reset
+            if not deferred:
+                return
+            self.sending = True
+
+    def connection_lost(self):
+        """ Treat the connection to the server as lost.
+
+        The client is disconnected and on_disconnect is called (if the
+        client was connected). This is called when the server closes the
+        connection or an ack does not arrive in time, and can be called by
+        other checks such as liveness.Heartbeat.
+        """
+
+        if self.disconnect() and self.on_disconnect is not None:
+            self.on_disconnect(self)
+
     def notify(self, term):
-        """ Send a notification to the server and return the ack. """
+        """ Send a notification to the server and return the ack.
+
+        term is either a string or a Prolog term (e.g. from
+        prolog_parser.from_python) which is written directly as bytes.
+        """
         
         if (self.connected):
-            self.datasock.send(from_str(str(term)+'\n'))
-            return self.get_ack()
+            buf = self._begin()
+            try:
+                buf.add(term)
+                buf.write(b'\n')
+            except:
+                self._abort(buf)
+                raise
+            return self._send(buf)
         else:
             return 0
+
+    def notify_many(self, terms):
+        """ Send the notifications in terms together and return the list of acks.
+
+        All the notifications are sent before any of the acks are read
+        (pipelining) which is much faster than calling notify for each one.
+        """
+
+        if (self.connected):
+            buf = self._begin()
+            try:
+                for term in terms:
+                    buf.add(term)
+                    buf.write(b'\n')
+            except:
+                self._abort(buf)
+                raise
+            if not terms:
+                self._abort(buf)
+                return []
+            return self._send(buf, len(terms))
+        else:
+            return [0 for _ in terms]
             
+    def notify_array(self, functor, *args, precision=3):
+        """ Send the notification functor(Arg1, ..., Samples) and return the ack.
+
+        The last of args is an array (or memoryview) of numbers which is sent
+        as a Prolog list - floats are written with precision decimal places.
+        The samples are formatted a chunk at a time straight into the send
+        buffer so no string is made for each sample.
+        A ValueError is raised (and nothing is sent) if a sample is an
+        infinity or NaN as Prolog has no syntax for them.
+        """
+
+        if not self.connected:
+            return 0
+        samples = args[-1]
+        if len(samples) and isinstance(samples[0], float):
+            for x in samples:
+                if isinf(x) or isnan(x):
+                    raise ValueError(repr(x))
+        buf = self._begin()
+        try:
+            buf.add(functor)
+            buf.write(b'(')
+            for arg in args[:-1]:
+                buf.add(arg)
+                buf.write(b', ')
+            buf.write(b'[')
+            n = len(samples)
+            if n:
+                conv = '%.' + str(precision) + 'f' if isinstance(samples[0], float) else '%d'
+                fmt = _samples_format(conv, _SAMPLE_CHUNK)
+                i = 0
+                while i < n:
+                    end = min(i + _SAMPLE_CHUNK, n)
+                    if end - i < _SAMPLE_CHUNK:
+                        fmt = _samples_format(conv, end - i)
+                    if i:
+                        buf.write(b', ')
+                    buf.write(from_str(fmt % tuple(samples[i:end])))
+                    i = end
+            buf.write(b'])\n')
+        except:
+            self._abort(buf)
+            raise
+        return self._send(buf)
+
     def subscribe(self, term, goal = "true", rock = 0):
         """ Send a subscription to the server and return the ack. """
-        if (self.connected):
-            self.datasock.send(from_str('subscribe(' + str(term) + ', (' +
-                           str(goal) + '), ' + str(rock) + ')\n'))
-            return self.get_ack()
+        if (self.connected and not self.sending):
+            buf = self._begin()
+            try:
+                buf.write(b'subscribe(')
+                buf.add(term)
+                buf.write(b', (')
+                buf.add(goal)
+                buf.write(b'), ')
+                buf.add(rock)
+                buf.write(b')\n')
+            except:
+                self._abort(buf)
+                raise
+            return self._send(buf)
         else:
             return 0
 
@@ -259,9 +752,16 @@ class PedroClient:
     def unsubscribe(self, id):
         """ Send an unsubscription to the server and return the ack. """
         
-        if (self.connected):
-            self.datasock.send(from_str('unsubscribe(' + str(id) + ')\n'))
-            return self.get_ack()
+        if (self.connected and not self.sending):
+            buf = self._begin()
+            try:
+                buf.write(b'unsubscribe(')
+                buf.add(id)
+                buf.write(b')\n')
+            except:
+                self._abort(buf)
+                raise
+            return self._send(buf)
         else:
             return 0
 
@@ -269,11 +769,19 @@ class PedroClient:
     def register(self, name):
         """ Register the client's name with the server and return the ack. """
         
-        if (self.connected):
-            self.datasock.send(from_str('register(' + name + ')\n'))
-            ack = self.get_ack()
+        if (self.connected and not self.sending):
+            buf = self._begin()
+            try:
+                buf.write(b'register(')
+                buf.add(name)
+                buf.write(b')\n')
+            except:
+                self._abort(buf)
+                raise
+            ack = self._send(buf)
             if (ack != 0):
                     self.name = name 
+                    self.name_version += 1
             return ack
         else:
             return 0
@@ -281,11 +789,19 @@ class PedroClient:
     def deregister(self):
         """ Unregister the client's name with the server and return the ack. """
         
-        if (self.connected):
-            self.datasock.send(from_str('deregister(' + self.name + ')\n'))
-            ack = self.get_ack()
+        if (self.connected and not self.sending):
+            buf = self._begin()
+            try:
+                buf.write(b'deregister(')
+                buf.add(self.name)
+                buf.write(b')\n')
+            except:
+                self._abort(buf)
+                raise
+            ack = self._send(buf)
             if (ack != 0):
                 self.name = ''
+                self.name_version += 1
             return ack
         else:
             return 0
@@ -294,27 +810,144 @@ class PedroClient:
     def p2p(self, toaddr, term):
         """ Send a p2p message to the server and return the ack. """
         
-        name = self.my_machine_name
-        if (self.name == ''):
+        if (self.name == '' or not self.connected):
             return 0
-        elif '@' in toaddr:
-            straddr = toaddr.replace('localhost', "'"+name+"'")
-            self.datasock.send(from_str('p2pmsg(' + straddr + ', '\
-                               + self.name + "@'" + name\
-                               +  "'," + str(term) + ')\n'))
-            return self.get_ack()
-        elif _p2p_var_addr.match(toaddr):
-            self.datasock.send(from_str('p2pmsg(' + toaddr \
-                                   + ", " \
-                                   + self.name + "@'" + name\
-                                   +  "'," + str(term) + ')\n'))
-            return self.get_ack()
-        else:
-            self.datasock.send(from_str('p2pmsg(' + toaddr \
-                                   + "@'" + name + "', " \
-                                   + self.name + "@'" + name\
-                                   +  "'," + str(term) + ')\n'))
-            return self.get_ack()
+        buf = self._begin()
+        try:
+            buf.add(self._p2p_prefix(toaddr))
+            buf.add(term)
+            buf.write(b')\n')
+        except:
+            self._abort(buf)
+            raise
+        return self._send(buf)
+
+    def peer(self, toaddr):
+        """ Return a Peer for sending p2p messages to toaddr.
+
+        The start of the p2p message is worked out once and reused for
+        each message sent to the peer.
+        """
+        return Peer(self, toaddr)
+
+    def _p2p_prefix(self, toaddr):
+        """ Return the start of a p2p message to toaddr (up to the term). """
+
+        name = self.my_machine_name
+        if '@' in toaddr:
+            toaddr = toaddr.replace('localhost', "'"+name+"'")
+        elif not _p2p_var_addr.match(toaddr):
+            toaddr = toaddr + "@'" + name + "'"
+        return 'p2pmsg(' + toaddr + ', ' + self.name + "@'" + name + "', "
+
+    def probe_latency(self, n=10, pipelined=False, timeout=2000):
+        """ Measure the latency of notifications through the server.
+
+        The client subscribes to pedro_probe(ID, Seq, T) (ID is the client's
+        ID) and sends n probes, timestamped with the time they were sent.
+        With pipelined False each probe waits for its echo (or timeout ms)
+        before the next is sent; otherwise all the probes are sent at once.
+        The client must have a reader to collect the echoes.
+
+        A dictionary is returned with the number of probes sent and received
+        and the (min, median, p99) times in microseconds for
+          rtt - from sending a probe to its echo arriving
+          ack - from sending a probe to its ack arriving
+          delivery - from the ack arriving to the echo arriving
+        (the times are None if no echoes were received). None is returned if
+        the probe could not be started.
+
+        With pipelined True the times include the time each probe waits
+        behind the earlier ones (at the server and while the acks are read)
+        and an echo can be read before its ack (a negative delivery time).
+        The echoes are collected between ack reads - by the loop in host
+        mode or by the reader timer on a Pico.
+
+        The first probe adds a handler that stays in place and consumes all
+        this client's probe messages, so echoes that arrive after a probe has
+        finished never reach the callback.
+        """
+
+        if not self.connected or self.reader is None or self.sending:
+            return None
+        if self.probe_prefix is None:
+            self.handlers.insert(0, self._probe)
+        prefix = 'pedro_probe(' + self.id_string.strip() + ','
+        self.probe_prefix = prefix
+        id = self.subscribe(prefix + ' Seq, T)')
+        if not id:
+            return None
+        # seq -> [sent, acked, delivered] (in ticks_us)
+        probes = {}
+        self.probes = probes
+        try:
+            if pipelined:
+                buf = self._begin()
+                try:
+                    for seq in range(n):
+                        sent = ticks.ticks_us()
+                        probes[seq] = [sent, None, None]
+                        buf.write(from_str(prefix + ' ' + str(seq) + ', ' + str(sent) + ')\n'))
+                    if buf.flush(self.ack_timeout):
+                        for seq in range(n):
+                            self.get_ack()
+                            probes[seq][1] = ticks.ticks_us()
+                            if self.loop is not None:
+                                # collect the echoes that have arrived so
+                                # their times are not held up until all the
+                                # acks have been read (the timer reader
+                                # runs on its own)
+                                self.loop.run_once(0)
+                    else:
+                        self.connection_lost()
+                finally:
+                    buf.n = 0
+                    self._end()
+                self._wait_for(lambda: all(t[2] is not None for t in probes.values()),
+                               timeout)
+            else:
+                for seq in range(n):
+                    sent = ticks.ticks_us()
+                    probes[seq] = [sent, None, None]
+                    self.notify(prefix + ' ' + str(seq) + ', ' + str(sent) + ')')
+                    probes[seq][1] = ticks.ticks_us()
+                    self._wait_for(lambda: probes[seq][2] is not None, timeout)
+        finally:
+            self.unsubscribe(id)
+            self.probes = None
+        received = [t for t in probes.values() if t[1] is not None and t[2] is not None]
+        return {'sent': n, 'received': len(received),
+                'rtt': _latency_summary([ticks.ticks_diff(t[2], t[0]) for t in received]),
+                'ack': _latency_summary([ticks.ticks_diff(t[1], t[0]) for t in received]),
+                'delivery': _latency_summary([ticks.ticks_diff(t[2], t[1]) for t in received])}
+
+    def _probe(self, message):
+        """ The handler for probe echoes (see probe_latency). """
+        prefix = self.probe_prefix
+        if not message.startswith(prefix):
+            return False
+        probes = self.probes
+        if probes is not None:
+            # an echo is matched on both Seq and T as Seq restarts
+            # from 0 for each probe
+            start = len(prefix)
+            pos = message.find(',', start)
+            times = probes.get(int(message[start:pos]))
+            if times is not None and times[2] is None and \
+               times[0] == int(message[pos+1:-1]):
+                times[2] = ticks.ticks_us()
+        return True
+
+    def _wait_for(self, done, timeout):
+        """ Wait up to timeout ms for done() while the reader runs. """
+        start = ticks.ticks_ms()
+        while not done() and self.connected and \
+              ticks.ticks_diff(ticks.ticks_ms(), start) < timeout:
+            if self.loop is not None:
+                self.loop.run_once(1)
+            else:
+                # the reader runs from its timer
+                ticks.sleep_ms(1)
 
     def _pop_rock(self, strn):
         """Gets the rock off of the message, returning (message_to_parse, rock)"""
@@ -29,6 +29,9 @@ more complex Prolog structures.
 """
 
 import re
+from array import array
+from math import isinf, isnan
+from collections import OrderedDict
 
 # Classes for Prolog terms
 
@@ -148,30 +151,144 @@ class PList(PObject):
 
     """ Prolog list subclass of PObject.
 
-    Stored as a cons pair.
+    Stored as a Python sequence of the elements together with the end of
+    the list (the tail after the last element - [] for a proper list), so
+    that the length and indexing are O(1). The elements are either a Python
+    list of Prolog terms or, for lists made with from_array, an array of
+    numbers that are made into Prolog terms when accessed.
+
+    head and tail are available as for a cons pair - the tail is a view
+    of the same elements and so the elements are not copied. Likewise a
+    list made from a head and a tail (or by from_elems with a list as the
+    end) keeps a reference to the tail rather than copying it - the
+    elements are gathered into one sequence the first time the list is
+    used as a whole (e.g. its length or end). So building a list a cons
+    at a time is O(n).
 
     """
     
     def __init__(self,h,t):
         """  h and t are the head an tail of the list."""
-        self.head = h
-        self.tail = t
         self.type = PObject.listtype
+        if t is None:
+            # the fields are set by from_elems or from_array
+            return
+        self.elems = [h]
+        self.start = 0
+        # what follows the elements - the end of the list or (until the
+        # elements are gathered) another list
+        self.rest = t
+        self.wrap = None
+
+    @classmethod
+    def from_elems(cls, elems, end=None):
+        """ Return the list of the Prolog terms in elems (a non-empty Python
+        list) followed by end ([] if end is None). """
+        if end is None:
+            end = PAtom('[]')
+        lst = cls(None, None)
+        lst.elems = elems
+        lst.start = 0
+        lst.rest = end
+        lst.wrap = None
+        return lst
+
+    @classmethod
+    def from_array(cls, arr):
+        """ Return the list of the numbers in arr (an array or memoryview).
+
+        The numbers are not copied - the list shares arr.
+        """
+        if len(arr) == 0:
+            return PAtom('[]')
+        lst = cls(None, None)
+        lst.elems = arr
+        lst.start = 0
+        lst.rest = PAtom('[]')
+        lst.wrap = PFloat if isinstance(arr[0], float) else PInteger
+        return lst
+
+    def __item(self, i):
+        """ Return the Prolog term of the element at position i of elems. """
+        if self.wrap is None:
+            return self.elems[i]
+        return self.wrap(self.elems[i])
+
+    def __segment(self):
+        """ Return a Python list of the elements before rest. """
+        if self.wrap is None:
+            return self.elems[self.start:]
+        wrap = self.wrap
+        return [wrap(x) for x in self.elems[self.start:]]
+
+    def __gather(self):
+        """ Gather the elements of the lists chained through rest. """
+        rest = self.rest
+        if rest.type != PObject.listtype:
+            return
+        elems = self.__segment()
+        while rest.type == PObject.listtype:
+            elems.extend(rest.__segment())
+            rest = rest.rest
+        self.elems = elems
+        self.start = 0
+        self.rest = rest
+        self.wrap = None
+
+    @property
+    def head(self):
+        return self.__item(self.start)
+
+    @property
+    def tail(self):
+        if self.start + 1 == len(self.elems):
+            return self.rest
+        lst = PList(None, None)
+        lst.elems = self.elems
+        lst.start = self.start + 1
+        lst.rest = self.rest
+        lst.wrap = self.wrap
+        return lst
+
+    @property
+    def end(self):
+        """ The end of the list (the tail after the last element). """
+        self.__gather()
+        return self.rest
+
+    def __len__(self):
+        """ Return the number of elements (not including the end). """
+        self.__gather()
+        return len(self.elems) - self.start
+
+    def __getitem__(self, i):
+        """ Return the i'th element. """
+        self.__gather()
+        n = len(self.elems) - self.start
+        if i < 0:
+            i += n
+        if i < 0 or i >= n:
+            raise IndexError(i)
+        return self.__item(self.start + i)
+
+    def items(self):
+        """ Return a Python list of the elements (ignoring the end). """
+        self.__gather()
+        return self.__segment()
+
+    def is_proper(self):
+        """ Test if the list ends with []. """
+        end = self.end
+        return end.type == PObject.atomtype and end.val == '[]'
 
     def __str__(self):
         """ Display the Prolog list in standard Prolog form. """
         
-        head = self.head
-        tail = self.tail
-        s = '[' + str(head)
-        while tail.type == PObject.listtype:
-            head = tail.head
-            tail = tail.tail
-            s += ', ' + str(head)
-        if tail.val == '[]':
+        s = '[' + ', '.join([str(x) for x in self.items()])
+        if self.is_proper():
             s += ']'
         else:
-            s += '|'+str(tail)+']'
+            s += '|'+str(self.end)+']'
         return s
             
     def toList(self):
@@ -180,23 +297,18 @@ class PList(PObject):
         return None if list does not end with a []
         """
 
-        lst = []
-        head = self.head
-        tail = self.tail
-        lst.append(head)
-        while tail.type == PObject.listtype:
-            head = tail.head
-            tail = tail.tail
-            lst.append(head)
-        if tail.val == '[]':
-            return lst
+        if self.is_proper():
+            return self.items()
         else:
             return None
         
     def __eq__(self, t):
-        if t.type != PObject.listtype:
+        if t.type != PObject.listtype or len(self) != len(t):
             return False
-        return self.head.__eq__(t.head) and self.tail.__eq__(t.tail)
+        for i in range(len(self)):
+            if not self[i].__eq__(t[i]):
+                return False
+        return self.end.__eq__(t.end)
 
 class PStruct(PObject):
 
@@ -338,17 +450,14 @@ class PrologParser:
     # return the list of terms representing list elements
     def __parselistargs(self):
         """ Return the list of prolog terms from a list."""
-        t1 = self.__prec700()
-        if (self.curr_token[1] == ','):
+        elems = [self.__prec700()]
+        while (self.curr_token[1] == ','):
             self.__next_token()
-            t2 = self.__parselistargs()
-            return PList(t1, t2)
-        elif self.curr_token[1] == '|':
+            elems.append(self.__prec700())
+        if self.curr_token[1] == '|':
             self.__next_token()
-            t2 = self.__prec700()
-            return PList(t1, t2)
-        else:
-            return PList(t1, PAtom('[]'))
+            return PList.from_elems(elems, self.__prec700())
+        return PList.from_elems(elems)
 
     # parsing a basic term
     def __basic(self):
@@ -547,3 +656,444 @@ class PrologParser:
             print ("Parse error at position", e.pos)
             return None
 
+
+
+class CachedParser:
+
+    """ A Prolog parser with a bounded LRU cache of parsed terms.
+
+    Messages that arrive over and over (such as control messages) are only
+    parsed the first time - after that the cached term is copied, which is
+    much cheaper than parsing. Each call returns its own copy and so the
+    terms returned can be changed without affecting later parses.
+    The cache is keyed by the message (a str or bytes - a bytearray or
+    memoryview is converted to bytes) and is limited both in the number of
+    entries and in the total size (in bytes) of the cached messages.
+    The least recently used entries are removed first.
+
+    hits and misses count the parses answered from (and not from) the cache.
+
+    """
+    def __init__(self, max_entries=16, max_bytes=1024):
+        """ max_entries and max_bytes are the limits on the cache size. """
+        self.parser = PrologParser()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # message -> (term, size of message in bytes)
+        self.cache = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, message):
+        """ Return the Prolog term for message (None if it does not parse). """
+        if not isinstance(message, (str, bytes)):
+            # bytearrays and memoryviews can not be dictionary keys
+            message = bytes(message)
+        entry = self.cache.pop(message, None)
+        if entry is not None:
+            # move to the most recently used end
+            self.cache[message] = entry
+            self.hits += 1
+            return copy_term(entry[0])
+        self.misses += 1
+        if isinstance(message, str):
+            term = self.parser.parse(message)
+            n = len(message.encode('utf-8'))
+        else:
+            term = self.parser.parse(message.decode('utf-8'))
+            n = len(message)
+        if term is None:
+            return None
+        if n > self.max_bytes or self.max_entries <= 0:
+            return term
+        self.cache[message] = (term, n)
+        self.size += n
+        while len(self.cache) > self.max_entries or \
+              self.size > self.max_bytes:
+            oldest = next(iter(self.cache))
+            self.size -= self.cache.pop(oldest)[1]
+        return copy_term(term)
+
+    def clear(self):
+        """ Empty the cache. """
+        self.cache = OrderedDict()
+        self.size = 0
+
+
+class StreamParser:
+
+    """ An incremental parser for a stream of newline terminated messages.
+
+    Bytes are received straight into the parser's buffer (space() gives the
+    free part of the buffer for recv_into and received(n) processes the n
+    bytes put there) or are copied in with feed(data). Any incomplete
+    message is kept at the start of the buffer until the rest arrives, and
+    the buffer is only reallocated when a message is longer than any before
+    it. As soon as a message is complete it is decoded straight from the
+    buffer, parsed and passed to the callback.
+
+    A message is only parsed once all of it has arrived - the parser is not
+    resumed part way through a message (messages are short and the parser
+    needs to look ahead for operators).
+
+    If rocks is True each message is expected to start with a Pedro rock
+    (an integer followed by a space) which is removed before parsing.
+    If raw is True the message string is passed to the callback
+    without being parsed (as for the PedroClient reader, whose handlers
+    only parse the messages they want). A CachedParser can be supplied as
+    the parser for streams of repetitive messages.
+
+    """
+    def __init__(self, callback, rocks=True, raw=False, parser=None, size=1024):
+        """ callback is called with each parsed term (or message string). """
+        self.callback = callback
+        self.rocks = rocks
+        self.raw = raw
+        self.parser = parser if parser is not None else PrologParser()
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        # the number of bytes in the buffer (the incomplete message)
+        self.n = 0
+
+    def space(self):
+        """ Return the free space at the end of the buffer (a memoryview). """
+        if self.n == len(self.buf):
+            buf = bytearray(2*len(self.buf))
+            buf[:self.n] = self.view[:self.n]
+            self.buf = buf
+            self.view = memoryview(buf)
+        return self.view[self.n:]
+
+    def received(self, k):
+        """ Process the k bytes that have been put in space(). """
+        view = self.view
+        end = self.n + k
+        start = 0
+        # only the new bytes need to be searched
+        pos = _find_newline(self.buf, view, self.n, end)
+        while (pos != -1):
+            self.__message(view[start:pos])
+            start = pos + 1
+            pos = _find_newline(self.buf, view, start, end)
+        if start:
+            # move the incomplete message to the start of the buffer
+            self.buf[:end-start] = bytes(view[start:end])
+        self.n = end - start
+
+    def feed(self, data):
+        """ Add the bytes in data to the stream. """
+        pos = 0
+        while pos < len(data):
+            space = self.space()
+            k = min(len(space), len(data) - pos)
+            space[:k] = data[pos:pos+k]
+            self.received(k)
+            pos += k
+
+    def __message(self, line):
+        """ Process a complete message (a memoryview of the buffer). """
+        # decode a complete message so that multi-byte characters
+        # split across chunks are decoded correctly
+        message = str(line, 'utf-8')
+        if self.rocks:
+            _, message = message.split(" ", 1)
+        if self.raw:
+            self.callback(message)
+            return
+        term = self.parser.parse(message)
+        if term is not None:
+            self.callback(term)
+
+def _find_newline(buf, view, start, end):
+    """ Return the position of the first newline in buf[start:end] (or -1). """
+    if hasattr(buf, 'find'):
+        return buf.find(b'\n', start, end)
+    # MicroPython bytearrays have no find
+    pos = bytes(view[start:end]).find(b'\n')
+    return pos if pos == -1 else start + pos
+
+
+# Conversion between Prolog terms and Python values
+#
+# to_python and from_python map between Prolog terms and Python values:
+#   integers and floats <-> int and float
+#   atoms <-> str (the atom [] is the empty list)
+#   strings <-> bytes (utf-8 encoded, so that they can be told apart from atoms)
+#   lists <-> list (arrays of numbers are also converted to lists)
+#   (A, B, ...) <-> tuple
+#   other structures <-> Struct
+# Terms without a Python equivalent (variables and lists not ending in [])
+# are left as Prolog terms. Both functions work iteratively (using a stack)
+# so that deeply nested terms do not use up the (small) Python stack.
+
+class Struct:
+
+    """ The Python value of a Prolog structure. """
+
+    def __init__(self, functor, args):
+        """ functor is the functor name (a str) and args the list of arguments. """
+        self.functor = functor
+        self.args = args
+
+    def __eq__(self, s):
+        return isinstance(s, Struct) and self.functor == s.functor and \
+            self.args == s.args
+
+    def __repr__(self):
+        return 'Struct(' + repr(self.functor) + ', ' + repr(self.args) + ')'
+
+
+class _Build:
+
+    """ A marker on the conversion stack - build a value from the last n values. """
+
+    def __init__(self, kind, n, name=None):
+        self.kind = kind
+        self.n = n
+        self.name = name
+
+# kinds of _Build markers
+_LIST = 0
+_TUPLE = 1
+_STRUCT = 2
+
+# Regular expressions for atoms that do not need quotes
+_plainAtomRE = re.compile(r"^([a-z][A-Za-z0-9_]*|[-/+*<=>#@$\\^&~`:.?!;]+|\[\])$")
+
+def _quote_atom(name):
+    """ Return the text of the atom with name, adding quotes if required. """
+    if _plainAtomRE.match(name):
+        return name
+    return "'" + name.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+def _atom_name(text):
+    """ Return the name of the atom with text (as produced by the parser). """
+    if text.startswith("'"):
+        return text[1:-1].replace("\\'", "'").replace('\\\\', '\\')
+    return text
+
+def _build(values, marker):
+    """ Replace the last marker.n values with the value marker describes. """
+    n = marker.n
+    args = values[len(values)-n:]
+    del values[len(values)-n:]
+    if marker.kind == _LIST:
+        values.append(args)
+    elif marker.kind == _TUPLE:
+        values.append(tuple(args))
+    else:
+        values.append(Struct(marker.name, args))
+
+def to_python(term):
+    """ Return the Python value of the Prolog term. """
+    todo = [term]
+    values = []
+    while todo:
+        t = todo.pop()
+        if isinstance(t, _Build):
+            _build(values, t)
+            continue
+        typ = t.type
+        if typ == PObject.inttype or typ == PObject.floattype:
+            values.append(t.val)
+        elif typ == PObject.atomtype:
+            if t.val == '[]':
+                values.append([])
+            else:
+                values.append(_atom_name(t.val))
+        elif typ == PObject.stringtype:
+            values.append(t.val.encode('utf-8'))
+        elif typ == PObject.listtype:
+            elems = t.toList()
+            if elems is None:
+                values.append(t)
+                continue
+            todo.append(_Build(_LIST, len(elems)))
+            todo.extend(reversed(elems))
+        elif typ == PObject.structtype:
+            if t.functor.val == ',' and t.arity() == 2:
+                # flatten (A, B, ...) into a tuple
+                elems = []
+                while t.type == PObject.structtype and \
+                      t.functor.val == ',' and t.arity() == 2:
+                    elems.append(t.args[0])
+                    t = t.args[1]
+                elems.append(t)
+                todo.append(_Build(_TUPLE, len(elems)))
+            else:
+                elems = t.args
+                todo.append(_Build(_STRUCT, len(elems),
+                                   _atom_name(t.functor.val)))
+            todo.extend(reversed(elems))
+        else:
+            values.append(t)
+    return values[0]
+
+def _make_term(values, marker):
+    """ Replace the last marker.n terms with the term marker describes. """
+    n = marker.n
+    args = values[len(values)-n:]
+    del values[len(values)-n:]
+    if marker.kind == _LIST:
+        t = PList.from_elems(args)
+    elif marker.kind == _TUPLE:
+        t = args[-1]
+        for a in reversed(args[:-1]):
+            t = PStruct(PAtom(','), [a, t])
+    else:
+        t = PStruct(PAtom(_quote_atom(marker.name)), args)
+    values.append(t)
+
+def from_python(value):
+    """ Return the Prolog term for the Python value.
+
+    A ValueError is raised if value has no Prolog equivalent.
+    """
+    todo = [value]
+    terms = []
+    while todo:
+        v = todo.pop()
+        if isinstance(v, _Build):
+            _make_term(terms, v)
+        elif isinstance(v, PObject):
+            terms.append(v)
+        elif isinstance(v, bool):
+            terms.append(PAtom('true' if v else 'false'))
+        elif isinstance(v, int):
+            terms.append(PInteger(v))
+        elif isinstance(v, float):
+            if isinf(v) or isnan(v):
+                raise ValueError(repr(v))
+            terms.append(PFloat(v))
+        elif isinstance(v, str):
+            terms.append(PAtom(_quote_atom(v)))
+        elif isinstance(v, bytes):
+            terms.append(PString(v.decode('utf-8')))
+        elif isinstance(v, array):
+            terms.append(PList.from_array(v))
+        elif isinstance(v, list):
+            if not v:
+                terms.append(PAtom('[]'))
+                continue
+            todo.append(_Build(_LIST, len(v)))
+            todo.extend(reversed(v))
+        elif isinstance(v, tuple):
+            if not v:
+                raise ValueError('empty tuple')
+            todo.append(_Build(_TUPLE, len(v)))
+            todo.extend(reversed(v))
+        elif isinstance(v, Struct):
+            todo.append(_Build(_STRUCT, len(v.args), v.functor))
+            todo.extend(reversed(v.args))
+        else:
+            raise ValueError(repr(v))
+    return terms[0]
+
+
+def copy_term(term):
+    """ Return a copy of the Prolog term that shares nothing with it. """
+    todo = [term]
+    terms = []
+    while todo:
+        t = todo.pop()
+        if isinstance(t, _Build):
+            n = t.n
+            args = terms[len(terms)-n:]
+            del terms[len(terms)-n:]
+            if t.kind == _LIST:
+                end = args.pop()
+                terms.append(PList.from_elems(args, end))
+            else:
+                terms.append(PStruct(args[0], args[1:]))
+            continue
+        typ = t.type
+        if typ == PObject.listtype:
+            elems = t.items()
+            todo.append(_Build(_LIST, len(elems) + 1))
+            todo.append(t.end)
+            todo.extend(reversed(elems))
+        elif typ == PObject.structtype:
+            todo.append(_Build(_STRUCT, len(t.args) + 1))
+            todo.extend(reversed(t.args))
+            todo.append(t.functor)
+        else:
+            terms.append(t.__class__(t.val))
+    return terms[0]
+
+
+# Writing Prolog terms
+#
+# write_term writes the text of a Prolog term (as bytes) to anything with a
+# write method (a socket send buffer, io.BytesIO, ...). Unlike str(term) it
+# does not build intermediate strings for the sub-terms and the text it
+# writes can always be read back by Prolog (e.g. strings are quoted).
+
+def _float_text(x):
+    """ Return the Prolog text of the float x.
+
+    A ValueError is raised for infinities and NaN as Prolog has no
+    syntax for them.
+    """
+    if isinf(x) or isnan(x):
+        raise ValueError(repr(x))
+    s = str(x)
+    if '.' not in s:
+        # Prolog needs a decimal point - e.g. 1e+20 is written as 1.0e+20
+        pos = s.find('e')
+        if pos == -1:
+            s = s + '.0'
+        else:
+            s = s[:pos] + '.0' + s[pos:]
+    return s
+
+def _string_text(s):
+    """ Return the Prolog text of the string s. """
+    return '"' + s.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+def write_term(term, out):
+    """ Write the text of the Prolog term to out. """
+    todo = [term]
+    while todo:
+        t = todo.pop()
+        if isinstance(t, bytes):
+            out.write(t)
+            continue
+        typ = t.type
+        if typ == PObject.structtype:
+            functor = t.functor.val
+            if functor == ',' and t.arity() == 2:
+                # written as (A, B) so that it reads back as the same term
+                out.write(b'(')
+                todo.append(b')')
+                todo.append(t.args[1])
+                todo.append(b', ')
+                todo.append(t.args[0])
+                continue
+            if not functor.startswith("'"):
+                functor = _quote_atom(functor)
+            out.write(functor.encode('utf-8'))
+            out.write(b'(')
+            todo.append(b')')
+            args = t.args
+            for i in range(len(args)-1, 0, -1):
+                todo.append(args[i])
+                todo.append(b', ')
+            if args:
+                todo.append(args[0])
+        elif typ == PObject.listtype:
+            out.write(b'[')
+            todo.append(b']')
+            if not t.is_proper():
+                todo.append(t.end)
+                todo.append(b'|')
+            for i in range(len(t)-1, 0, -1):
+                todo.append(t[i])
+                todo.append(b', ')
+            todo.append(t[0])
+        elif typ == PObject.stringtype:
+            out.write(_string_text(t.val).encode('utf-8'))
+        elif typ == PObject.floattype:
+            out.write(_float_text(t.val).encode('utf-8'))
+        else:
+            out.write(str(t.val).encode('utf-8'))
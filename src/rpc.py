@@ -0,0 +1,195 @@
+#  Copyright (C) 2025 Peter Robinson
+#  Email: pjr4171@gmail.com
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+""" Request/response calls over Pedro peer-to-peer messages.
+
+A request is sent to a peer as the p2p message
+
+    rpc_request(ID, Term)
+
+and the peer answers with
+
+    rpc_reply(ID, Result)
+
+sent back to the address the request came from. The ID (an integer) is used
+to match the reply to the outstanding call so that many calls can be in
+progress at the same time. Each call has a deadline - if no reply has
+arrived by then the call's callback is called with None.
+
+Deadlines are only checked when a reply arrives, a call is made, or
+check_timeouts() (or wait()) is called - there is no timer for them. An
+application that can go quiet must call check_timeouts() regularly (e.g. as
+a scheduler task) for expired calls to be reported on time.
+
+The request and reply are sent as Prolog terms (written with write_term) so
+that strings and conjunctions arrive as they were sent. A term given as a
+Python string is parsed and any other Python value is converted with
+from_python.
+
+Replies are picked up by the client's reader and so a client used for RPC
+must be created with a reader_period > 0. As the reader calls the callbacks
+from its timer, callbacks should be kept short.
+"""
+
+import ticks
+from prolog_parser import PrologParser, PObject, PStruct, PInteger, PString, from_python
+
+
+class RPC:
+    """ RPC on top of the p2p messages of a PedroClient.
+
+    The methods are:
+
+    call(addr, term, callback, timeout) - send term as a request to addr
+      (an address string or a Peer from PedroClient.peer).
+      callback(result) is called with the reply (a Prolog term) or None if
+      the call times out. The ID of the call is returned (0 if the request
+      could not be sent).
+
+    serve(handler) - answer requests from other clients - handler(term) is
+      called with each request and its return value (a Prolog term, a string
+      to be parsed or a Python value) is sent as the reply. If handler raises
+      an exception (or its value can not be converted to a term) the reply
+      is error(Text) where Text is a string describing the exception.
+
+    wait(id) - wait until the call with the given ID has completed.
+
+    check_timeouts() - expire calls whose deadline has passed - this must be
+      called regularly as nothing else checks the deadlines while no
+      messages arrive.
+
+    pending() - the number of outstanding calls.
+    """
+
+    def __init__(self, client, timeout=5000, parser=None):
+        """ Initialize the RPC layer.
+        client: the PedroClient used to send and receive messages - the
+            client must have been registered (p2p messages need a name).
+        timeout: the default deadline (in ms) for calls.
+        parser: the Prolog parser used for incoming messages.
+        """
+        self.client = client
+        self.timeout = timeout
+        self.parser = parser if parser is not None else PrologParser()
+        self.server = None
+        # the table of outstanding calls - ID -> (deadline, callback)
+        self.calls = {}
+        self.next_id = 1
+        client.add_handler(self._handle)
+
+    def call(self, addr, term, callback, timeout=None):
+        """ Send term to addr as a request and return the call ID. """
+
+        if timeout is None:
+            timeout = self.timeout
+        self.check_timeouts()
+        id = self.next_id
+        request = PStruct('rpc_request', [PInteger(id), self._term(term)])
+        self.next_id += 1
+        # the reply can arrive before the ack so the call must be in the
+        # table before the request is sent
+        self.calls[id] = (ticks.ticks_add(ticks.ticks_ms(), timeout), callback)
+        if isinstance(addr, str):
+            ack = self.client.p2p(addr, request)
+        else:
+            ack = addr.p2p(request)
+        if not ack:
+            del self.calls[id]
+            return 0
+        return id
+
+    def serve(self, handler):
+        """ Use handler to answer incoming requests. """
+        self.server = handler
+
+    def pending(self):
+        """ Return the number of outstanding calls. """
+        return len(self.calls)
+
+    def wait(self, id, poll=5):
+        """ Wait (polling every poll ms) until call id is no longer pending.
+
+        If the client's reader is run by a loop (host mode) the loop is run
+        while waiting, otherwise the reader runs from its timer. Either way
+        this must not be called from within a callback.
+        """
+        loop = self.client.loop
+        while id in self.calls:
+            if loop is not None:
+                loop.run_once(poll)
+            else:
+                ticks.sleep_ms(poll)
+            self.check_timeouts()
+
+    def check_timeouts(self):
+        """ Call the callback with None for each call that has expired. """
+
+        if not self.calls:
+            return
+        now = ticks.ticks_ms()
+        expired = [id for id, (deadline, _) in self.calls.items()
+                   if ticks.ticks_diff(now, deadline) >= 0]
+        for id in expired:
+            entry = self.calls.pop(id, None)
+            if entry is not None:
+                entry[1](None)
+
+    def _term(self, x):
+        """ Return x as a Prolog term (parsing it if it is a string). """
+        if isinstance(x, PObject):
+            return x
+        if isinstance(x, str):
+            term = self.parser.parse(x)
+            if term is None:
+                raise ValueError(x)
+            return term
+        return from_python(x)
+
+    def _handle(self, message):
+        """ The client handler - consume RPC messages and ignore the rest. """
+
+        # only parse messages that could be for us
+        if not message.startswith('p2pmsg(') or \
+           ('rpc_reply(' not in message and 'rpc_request(' not in message):
+            return False
+        term = self.parser.parse(message)
+        if term is None or term.type != PObject.structtype or \
+           term.arity() != 3:
+            return False
+        msg = term.args[2]
+        if msg.type != PObject.structtype or msg.arity() != 2 or \
+           msg.args[0].type != PObject.inttype:
+            return False
+        id = msg.args[0].val
+        if msg.functor.val == 'rpc_reply':
+            entry = self.calls.pop(id, None)
+            if entry is not None:
+                entry[1](msg.args[1])
+            self.check_timeouts()
+            return True
+        if msg.functor.val == 'rpc_request' and self.server is not None:
+            try:
+                result = self._term(self.server(msg.args[1]))
+            except Exception as e:
+                # the error is sent as the reply rather than raised out
+                # of the reader (and so the caller does not time out)
+                result = PStruct('error', [PString(repr(e))])
+            # reply to the sender address
+            self.client.p2p(str(term.args[1]),
+                            PStruct('rpc_reply', [PInteger(id), result]))
+            return True
+        return False
@@ -0,0 +1,192 @@
+#  Copyright (C) 2025 Peter Robinson
+#  Email: pjr4171@gmail.com
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+""" Periodic publisher scheduler.
+
+This module runs any number of periodic tasks - typically reading a sensor
+and publishing the reading as a notification. Each task has its own period
+which can be changed while the scheduler is running (for example from the
+callback for a set_sample_rate notification).
+
+The tasks are kept in a heap ordered on their next deadline. Each deadline
+is computed from the previous deadline (not from when the task actually ran)
+so that the time taken sampling and sending does not accumulate as drift.
+All the notifications from tasks that are due at the same time are sent
+together with PedroClient.notify_many.
+"""
+
+import ticks
+import heapq
+
+
+def _check_period(period):
+    """ Raise a ValueError if period is not a valid task period. """
+    if period < 1:
+        raise ValueError('period must be at least 1 ms: ' + str(period))
+
+
+class Task:
+    """ A periodic task - see Scheduler.add. """
+
+    def __init__(self, name, period, sample):
+        self.name = name
+        self.period = period
+        self.sample = sample
+        # the period requested by set_period (applied by the scheduler)
+        self.new_period = None
+        # incremented when the task is rescheduled - heap entries with an
+        # older version are ignored
+        self.version = 0
+        self.deadline = 0
+
+
+class Scheduler:
+    """ Run periodic tasks and publish their notifications.
+
+    The methods are:
+
+    add(name, period, sample) - add a task called name that calls sample()
+      every period ms. sample returns the notification to publish (a string
+      or Prolog term) or None if there is nothing to publish.
+
+    remove(name) - remove the task called name.
+
+    set_period(name, period) - change the period of the task called name.
+
+    run_once() - run the tasks that are due and return the time (in ms)
+      until the next task is due.
+
+    run(slice) - run the tasks forever, checking for period changes
+      every slice ms.
+    """
+
+    def __init__(self, client):
+        """ client is the PedroClient used to send the notifications. """
+        self.client = client
+        self.tasks = {}
+        # entries are (deadline, seq, version, task)
+        self.heap = []
+        self.seq = 0
+        # the time in ms since the scheduler started - unlike ticks_ms
+        # this does not wrap around and so can be used in the heap
+        self.now = 0
+        self.last_ticks = ticks.ticks_ms()
+        self.changed = False
+
+    def add(self, name, period, sample):
+        """ Add a task that is first run now and then every period ms.
+
+        A ValueError is raised if period is less than 1.
+        """
+        _check_period(period)
+        task = Task(name, period, sample)
+        self.tasks[name] = task
+        self._schedule(task, self._clock())
+        return task
+
+    def remove(self, name):
+        """ Remove the task called name. """
+        task = self.tasks.pop(name, None)
+        if task is not None:
+            # invalidate its heap entry
+            task.version += 1
+
+    def set_period(self, name, period):
+        """ Change the period (in ms) of the task called name.
+
+        This can be called from a callback - the change is made by the
+        scheduler the next time it runs. A ValueError is raised if period
+        is less than 1.
+        """
+        _check_period(period)
+        task = self.tasks.get(name)
+        if task is not None:
+            task.new_period = period
+            self.changed = True
+
+    def _clock(self):
+        """ Return the time in ms since the scheduler started. """
+        t = ticks.ticks_ms()
+        self.now += ticks.ticks_diff(t, self.last_ticks)
+        self.last_ticks = t
+        return self.now
+
+    def _schedule(self, task, deadline):
+        """ Add a heap entry for task at deadline. """
+        task.version += 1
+        task.deadline = deadline
+        self.seq += 1
+        heapq.heappush(self.heap, (deadline, self.seq, task.version, task))
+
+    def _apply_periods(self, now):
+        """ Apply the period changes made by set_period. """
+        self.changed = False
+        for task in self.tasks.values():
+            period = task.new_period
+            if period is None:
+                continue
+            task.new_period = None
+            # the next run is one new period after the last run
+            # (or now if that has already passed)
+            last = task.deadline - task.period
+            task.period = period
+            self._schedule(task, max(last + period, now))
+
+    def run_once(self):
+        """ Run the tasks that are due and return the ms until the next is due. """
+        now = self._clock()
+        if self.changed:
+            self._apply_periods(now)
+        heap = self.heap
+        due = []
+        while heap and heap[0][0] <= now:
+            deadline, _, version, task = heapq.heappop(heap)
+            if version != task.version:
+                continue
+            term = task.sample()
+            if term is not None:
+                due.append(term)
+            deadline += task.period
+            if deadline <= now:
+                # skip the periods that have been missed rather than
+                # running the task several times to catch up
+                deadline += ((now - deadline) // task.period + 1) * task.period
+            self._schedule(task, deadline)
+        if due:
+            self.client.notify_many(due)
+        if not heap:
+            return -1
+        return max(0, heap[0][0] - self._clock())
+
+    def run(self, slice=100):
+        """ Run the tasks forever.
+
+        The wait for the next task is made in steps of at most slice ms so
+        that a period changed by set_period (e.g. from a callback) is applied
+        within slice ms rather than after the old period.
+        """
+        while True:
+            delay = self.run_once()
+            if delay < 0:
+                # no tasks - check again later
+                delay = 1000
+            end = ticks.ticks_add(ticks.ticks_ms(), delay)
+            while not self.changed:
+                remaining = ticks.ticks_diff(end, ticks.ticks_ms())
+                if remaining <= 0:
+                    break
+                ticks.sleep_ms(min(remaining, slice))
@@ -0,0 +1,43 @@
+#  Copyright (C) 2025 Peter Robinson
+#  Email: pjr4171@gmail.com
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+""" Millisecond and microsecond ticks.
+
+On micropython these are the functions from the time module. On CPython
+(host mode) equivalents are defined using time.monotonic_ns - these do not
+wrap around and so ticks_diff and ticks_add are simple arithmetic.
+"""
+
+import time
+
+try:
+    from time import ticks_ms, ticks_us, ticks_diff, ticks_add, sleep_ms
+except ImportError:
+    def ticks_ms():
+        return time.monotonic_ns() // 1000000
+
+    def ticks_us():
+        return time.monotonic_ns() // 1000
+
+    def ticks_diff(t1, t2):
+        return t1 - t2
+
+    def ticks_add(t, delta):
+        return t + delta
+
+    def sleep_ms(ms):
+        time.sleep(ms / 1000)